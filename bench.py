@@ -0,0 +1,407 @@
+"""Offline load test for app.py.
+
+Starts a local mock upstream that replays every provider's wire format at a
+configurable latency and token rate, starts app.py (WSGI or ASGI) pointed at
+it, then drives concurrent /chat and /upload_image traffic and reports
+throughput, TTFT percentiles, memory per stream and DB write rate.
+
+    python bench.py --requests 500 --concurrency 50 --server asgi
+    python bench.py --models qwen-coder --tokens 400 --token-delay-ms 2 --json
+"""
+import os
+import sys
+import io
+import json
+import logging
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS = ['kimi-k2-coder', 'gpt-5-mini', 'qwen-coder', 'deepseek-coder', 'chat-gpt-5-coder', 'chat-gpt-5-nano', 'pro-reasoner-high']
+ERROR_PREFIXES = ("🚨", "🤖", "🚫")
+
+# ==============================================================================
+# Mock Upstream
+# ==============================================================================
+# One server, one path per provider. Responses use chunked transfer encoding
+# so keep-alive and incremental parsing behave like the real services.
+def sse(payload):
+    return b"data: " + json.dumps(payload).encode() + b"\n\n"
+
+def text_delta_frames(token):
+    return sse({"type": "text-delta", "id": "0", "delta": token})
+
+def openai_frames(token):
+    return sse({"choices": [{"index": 0, "delta": {"content": token}}]})
+
+def ndjson_frames(token):
+    return json.dumps({"choices": [{"delta": {"content": token, "reasoning_content": None}}]}).encode() + b"\n"
+
+def raw_frames(token):
+    return token.encode()
+
+STREAMS = {
+    '/kimi': (text_delta_frames, b"data: [DONE]\n\n"),
+    '/gpt5': (text_delta_frames, b"data: [DONE]\n\n"),
+    '/deepseek': (openai_frames, b"data: [DONE]\n\n"),
+    '/nano': (openai_frames, b"data: [DONE]\n\n"),
+    '/qwen': (raw_frames, b""),
+    '/claila/unichat': (raw_frames, b""),
+    '/updf/talk': (ndjson_frames, b""),
+}
+
+class MockUpstream(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.05
+    token_delay = 0.005
+    tokens = 200
+
+    def log_message(self, *args):
+        pass
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except (BrokenPipeError, ConnectionResetError):
+            # A pooled keep-alive connection the app dropped or reset between requests.
+            self.close_connection = True
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        if data:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == '/claila/csrf':
+            self.send_body(b"bench-csrf-token", "text/plain")
+        elif path == '/claila/chat':
+            self.send_body(b"<script>window.app = { session_id : 'bench-session' };</script>", "text/html")
+        elif path == '/updf/single-chat-id':
+            self.send_body(json.dumps({"code": 200, "data": {"single_chat_id": "bench-chat"}}).encode(), "application/json")
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length") or 0))
+        path = self.path.split("?")[0]
+        if path not in STREAMS:
+            self.send_error(404)
+            return
+        frame, trailer = STREAMS[path]
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+        time.sleep(self.latency)
+        try:
+            if path == '/updf/talk':
+                self.write_chunk(json.dumps({"choices": [{"delta": {"content": "", "reasoning_content": "thinking "}}]}).encode() + b"\n")
+            for i in range(self.tokens):
+                self.write_chunk(frame(f"tok{i} "))
+                if self.token_delay:
+                    time.sleep(self.token_delay)
+            self.write_chunk(trailer)
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The app hung up early, e.g. because its own client disconnected.
+            self.close_connection = True
+
+    do_PUT = do_POST
+
+def serve_upstream(args):
+    MockUpstream.latency = args.latency_ms / 1000
+    MockUpstream.token_delay = args.token_delay_ms / 1000
+    MockUpstream.tokens = args.tokens
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), MockUpstream)
+    server.daemon_threads = True
+    server.serve_forever()
+
+# ==============================================================================
+# App Under Test
+# ==============================================================================
+def point_at_upstream(app, base):
+    app.kimi_k2_url = base + '/kimi'
+    app.claila_csrf_url = base + '/claila/csrf'
+    app.claila_chat_url = base + '/claila/chat'
+    app.claila_url = base + '/claila/unichat'
+    app.qwen_coder_url = base + '/qwen'
+    app.deepseek_url = base + '/deepseek'
+    app.chat_gpt5_url = base + '/gpt5'
+    app.chat_gpt5_nano_url = base + '/nano'
+    app.pro_reasoner_url = base + '/updf/talk'
+    app.pro_reasoner_chat_id_url = base + '/updf/single-chat-id'
+
+def serve_app(args):
+    os.chdir(args.workdir)
+    os.environ.setdefault("IMAGE_DIR", os.path.join(args.workdir, "images"))
+    sys.path.insert(0, REPO_DIR)
+    import app
+    point_at_upstream(app, args.upstream)
+    app.init_db()
+    if args.server == "asgi":
+        import uvicorn
+        uvicorn.run(app.asgi_app, host="127.0.0.1", port=args.port, log_level="warning", backlog=2048)
+    else:
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        make_server("127.0.0.1", args.port, app.app, threaded=True).serve_forever()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"nothing listening on port {port} after {timeout}s")
+
+def spawn(*argv):
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), *argv])
+
+def rss_bytes(pid):
+    # Linux only; memory figures are reported as n/a elsewhere.
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+# ==============================================================================
+# Driver
+# ==============================================================================
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def percentile_ms(values, p):
+    value = percentile(values, p)
+    return None if value is None else value * 1000
+
+def metric_value(text, name):
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[1])
+    return 0.0
+
+async def scrape_writes(client):
+    r = await client.get("/metrics")
+    if r.status_code != 200:
+        return None
+    return metric_value(r.text, "db_write_batch_size_sum"), metric_value(r.text, "db_write_batch_size_count")
+
+async def one_chat(client, i, args, models, results):
+    session = f"bench-{i % args.sessions}" if args.sessions else f"bench-{i}"
+    payload = {"session": session, "model": models[i % len(models)], "action": "chat", "text": f"benchmark prompt {i}"}
+    start = time.perf_counter()
+    first = None
+    body = b""
+    status = None
+    try:
+        async with client.stream("POST", "/chat", json=payload) as r:
+            async for chunk in r.aiter_bytes():
+                if chunk and first is None:
+                    first = time.perf_counter() - start
+                body += chunk
+        status = r.status_code
+        text = body.decode("utf-8", "replace")
+        ok = status == 200 and bool(text) and not text.startswith(ERROR_PREFIXES)
+    except Exception as e:
+        ok, text = False, str(e)
+    results.append({"model": payload["model"], "ok": ok, "status": status, "ttft": first, "total": time.perf_counter() - start, "bytes": len(body), "error": None if ok else text[:200]})
+
+async def one_upload(client, image, results):
+    start = time.perf_counter()
+    try:
+        r = await client.post("/upload_image", files={"file": ("bench.png", image, "image/png")})
+        ok = r.status_code == 200
+    except Exception:
+        ok = False
+    results.append({"ok": ok, "total": time.perf_counter() - start})
+
+async def run_pool(total, concurrency, make):
+    counter = iter(range(total))
+    async def worker():
+        for i in counter:
+            await make(i)
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+def make_image(size):
+    from PIL import Image
+    image = Image.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def summarize_chat(results, elapsed, peak_rss, base_rss, concurrency, writes):
+    ttfts = [r["ttft"] for r in results if r["ok"] and r["ttft"] is not None]
+    totals = [r["total"] for r in results if r["ok"]]
+    errors = [r for r in results if not r["ok"]]
+    summary = {
+        "requests": len(results),
+        "errors": len(errors),
+        "shed_503": sum(r["status"] == 503 for r in results),
+        "throughput_rps": len(results) / elapsed if elapsed else None,
+        "output_bytes_per_s": sum(r["bytes"] for r in results) / elapsed if elapsed else None,
+        "ttft_p50_ms": percentile_ms(ttfts, 50),
+        "ttft_p99_ms": percentile_ms(ttfts, 99),
+        "total_p50_ms": percentile_ms(totals, 50),
+        "total_p99_ms": percentile_ms(totals, 99),
+        "memory_per_stream_kb": (peak_rss - base_rss) / concurrency / 1024 if peak_rss and base_rss else None,
+        "peak_rss_mb": peak_rss / 2**20 if peak_rss else None,
+        "db_writes_per_s": writes[0] / elapsed if writes else None,
+        "db_commits_per_s": writes[1] / elapsed if writes else None,
+        "first_errors": sorted({e["error"] for e in errors if e["error"]})[:3],
+    }
+    per_model = {}
+    for r in results:
+        per_model.setdefault(r["model"], []).append(r)
+    summary["per_model"] = {model: {"requests": len(rs), "errors": sum(not r["ok"] for r in rs), "ttft_p50_ms": percentile_ms([r["ttft"] for r in rs if r["ok"] and r["ttft"] is not None], 50) or 0.0} for model, rs in per_model.items()}
+    return summary
+
+def summarize_uploads(results, elapsed):
+    totals = [r["total"] for r in results if r["ok"]]
+    return {
+        "requests": len(results),
+        "errors": sum(not r["ok"] for r in results),
+        "throughput_rps": len(results) / elapsed if elapsed else None,
+        "latency_p50_ms": percentile_ms(totals, 50),
+        "latency_p99_ms": percentile_ms(totals, 99),
+    }
+
+async def drive(args, app_pid, base):
+    import httpx
+    models = MODELS if args.models == "all" else [m.strip() for m in args.models.split(",")]
+    limits = httpx.Limits(max_connections=args.concurrency + 10, max_keepalive_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=base, timeout=120, limits=limits) as client:
+        # Warm up provider bootstraps and connection pools before measuring.
+        await asyncio.gather(*(one_chat(client, -1 - n, argparse.Namespace(sessions=0), [model], []) for n, model in enumerate(models)))
+        report = {"config": {k: v for k, v in vars(args).items() if k not in ("command", "func")}}
+
+        if args.requests:
+            results = []
+            base_rss = peak_rss = rss_bytes(app_pid)
+            done = asyncio.Event()
+            async def sample_rss():
+                nonlocal peak_rss
+                while not done.is_set():
+                    rss = rss_bytes(app_pid)
+                    if rss and (peak_rss is None or rss > peak_rss):
+                        peak_rss = rss
+                    await asyncio.sleep(0.05)
+            sampler = asyncio.ensure_future(sample_rss())
+            writes_before = await scrape_writes(client)
+            start = time.perf_counter()
+            await run_pool(args.requests, args.concurrency, lambda i: one_chat(client, i, args, models, results))
+            elapsed = time.perf_counter() - start
+            done.set()
+            await sampler
+            writes_after = await scrape_writes(client)
+            writes = (writes_after[0] - writes_before[0], writes_after[1] - writes_before[1]) if writes_before and writes_after else None
+            report["chat"] = summarize_chat(results, elapsed, peak_rss, base_rss, args.concurrency, writes)
+
+        if args.uploads:
+            image = make_image(args.image_size)
+            results = []
+            start = time.perf_counter()
+            await run_pool(args.uploads, args.concurrency, lambda i: one_upload(client, image, results))
+            report["upload"] = summarize_uploads(results, time.perf_counter() - start)
+    return report
+
+def format_report(report):
+    lines = []
+    for section in ("chat", "upload"):
+        if section not in report:
+            continue
+        lines.append(f"== {section} ==")
+        for key, value in report[section].items():
+            if key == "per_model":
+                for model, stats in value.items():
+                    lines.append(f"  {model:<20} requests={stats['requests']} errors={stats['errors']} ttft_p50={stats['ttft_p50_ms']:.1f}ms")
+            elif isinstance(value, float):
+                lines.append(f"{key:<22} {value:,.1f}")
+            else:
+                lines.append(f"{key:<22} {value if value is not None else 'n/a'}")
+    return "\n".join(lines)
+
+def run(args):
+    upstream_port, app_port = free_port(), free_port()
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    procs = [spawn("upstream", "--port", str(upstream_port), "--latency-ms", str(args.latency_ms), "--token-delay-ms", str(args.token_delay_ms), "--tokens", str(args.tokens))]
+    try:
+        wait_for_port(upstream_port)
+        procs.append(spawn("app", "--port", str(app_port), "--upstream", f"http://127.0.0.1:{upstream_port}", "--server", args.server, "--workdir", workdir))
+        wait_for_port(app_port)
+        report = asyncio.run(drive(args, procs[-1].pid, f"http://127.0.0.1:{app_port}"))
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for app.py against local mock upstreams.")
+    sub = parser.add_subparsers(dest="command")
+    def add_stream_options(p):
+        p.add_argument("--latency-ms", type=float, default=50, help="upstream delay before the first token")
+        p.add_argument("--token-delay-ms", type=float, default=5, help="upstream delay between tokens")
+        p.add_argument("--tokens", type=int, default=200, help="tokens per upstream response")
+
+    run_parser = sub.add_parser("run", help="start both servers and drive load (default)")
+    add_stream_options(run_parser)
+    run_parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    run_parser.add_argument("--models", default="all", help="comma-separated models, or 'all'")
+    run_parser.add_argument("--requests", type=int, default=200, help="/chat requests to send")
+    run_parser.add_argument("--uploads", type=int, default=50, help="/upload_image requests to send")
+    run_parser.add_argument("--concurrency", type=int, default=20)
+    run_parser.add_argument("--sessions", type=int, default=0, help="spread requests over this many sessions (0 = one per request)")
+    run_parser.add_argument("--image-size", type=int, default=1024, help="edge length of the uploaded test image")
+    run_parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    run_parser.set_defaults(func=run)
+
+    upstream_parser = sub.add_parser("upstream", help="run only the mock upstream")
+    add_stream_options(upstream_parser)
+    upstream_parser.add_argument("--port", type=int, default=8900)
+    upstream_parser.set_defaults(func=serve_upstream)
+
+    app_parser = sub.add_parser("app", help="run app.py pointed at a mock upstream")
+    app_parser.add_argument("--port", type=int, default=5000)
+    app_parser.add_argument("--upstream", default="http://127.0.0.1:8900")
+    app_parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    app_parser.add_argument("--workdir", default=tempfile.gettempdir())
+    app_parser.set_defaults(func=serve_app)
+
+    argv = sys.argv[1:]
+    if not argv or argv[0] not in ("run", "upstream", "app", "-h", "--help"):
+        argv = ["run", *argv]
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
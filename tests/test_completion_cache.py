@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def scratch_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+class Source:
+    """Async chunk source that records whether it was closed or cancelled."""
+    def __init__(self, chunks=5, delay=0.02):
+        self.chunks = chunks
+        self.delay = delay
+        self.closed = False
+        self.cancelled = False
+
+    async def stream(self):
+        try:
+            for i in range(self.chunks):
+                await asyncio.sleep(self.delay)
+                yield f"c{i} "
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        finally:
+            self.closed = True
+
+
+def make_flight(source):
+    completions = []
+    flight = app.AsyncFlight(source.stream(), lambda f, exhausted: completions.append((exhausted, "".join(f.chunks))))
+    return flight, completions
+
+
+async def collect(listener):
+    return "".join([chunk async for chunk in listener])
+
+
+def test_cancelled_listener_does_not_truncate_the_others():
+    async def main():
+        source = Source()
+        flight, completions = make_flight(source)
+        first = asyncio.ensure_future(collect(flight.alisten()))
+        second = asyncio.ensure_future(collect(flight.alisten()))
+        await asyncio.sleep(0.05)  # both listeners are waiting on the third pull
+        first.cancel()
+        return source, completions, await second, first
+    source, completions, text, first = asyncio.run(main())
+    assert first.cancelled()
+    assert text == "c0 c1 c2 c3 c4 "
+    assert completions == [(True, "c0 c1 c2 c3 c4 ")]
+    assert not source.cancelled
+
+
+def test_last_listener_leaving_closes_the_source_without_caching():
+    async def main():
+        source = Source()
+        flight, completions = make_flight(source)
+        only = asyncio.ensure_future(collect(flight.alisten()))
+        await asyncio.sleep(0.05)
+        only.cancel()
+        await asyncio.gather(only, return_exceptions=True)
+        return source, completions
+    source, completions = asyncio.run(main())
+    assert source.closed
+    assert [exhausted for exhausted, _ in completions] == [False]
+
+
+def test_late_listener_replays_buffered_chunks():
+    async def main():
+        source = Source(chunks=3)
+        flight, completions = make_flight(source)
+        first = asyncio.ensure_future(collect(flight.alisten()))
+        await asyncio.sleep(0.03)
+        second = await collect(flight.alisten())
+        return await first, second, completions
+    first, second, completions = asyncio.run(main())
+    assert first == second == "c0 c1 c2 "
+    assert completions == [(True, "c0 c1 c2 ")]
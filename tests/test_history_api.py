@@ -0,0 +1,100 @@
+import uuid
+
+import pytest
+
+import app
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    app.DB = str(tmp_path_factory.mktemp("db") / "chat_history.db")
+    app.init_db()
+    return app.app.test_client()
+
+
+def new_session(*messages):
+    sid = str(uuid.uuid4())
+    for role, text in messages:
+        app.save_msg(sid, role, text)
+    app.db_writer.wait(sid)
+    return sid
+
+
+def test_listing_and_search_need_ids(client):
+    new_session(("user", "my password is hunter2"))
+    assert client.get("/sessions").status_code == 400
+    assert client.get("/search?q=hunter2").status_code == 400
+
+
+def test_timestamp_session_ids_are_not_served(client):
+    app.save_msg("1700000000000", "user", "legacy secret")
+    app.db_writer.wait()
+    assert client.get("/history?session=1700000000000").status_code == 403
+    assert client.get("/sessions?ids=1700000000000").status_code == 400
+    assert client.get("/search?q=legacy&ids=1700000000000").status_code == 400
+
+
+def test_only_named_sessions_are_returned(client):
+    mine = new_session(("user", "hello orchids"), ("bot", "orchids like shade"))
+    theirs = new_session(("user", "orchids are my secret"))
+    sessions = client.get(f"/sessions?ids={mine}").get_json()["sessions"]
+    assert [s["session_id"] for s in sessions] == [mine]
+    results = client.get(f"/search?q=orchids&ids={mine}").get_json()["results"]
+    assert {r["session_id"] for r in results} == {mine}
+    assert theirs not in {r["session_id"] for r in results}
+
+
+def test_history_pages_backwards(client):
+    sid = new_session(*[("user" if i % 2 == 0 else "bot", f"m{i}") for i in range(7)])
+    page = client.get(f"/history?session={sid}&limit=3").get_json()
+    assert [m["content"] for m in page["messages"]] == ["m4", "m5", "m6"]
+    older = client.get(f"/history?session={sid}&limit=3&before={page['before']}").get_json()
+    assert [m["content"] for m in older["messages"]] == ["m1", "m2", "m3"]
+    rest = client.get(f"/history?session={sid}&limit=3&before={older['before']}").get_json()
+    assert [m["content"] for m in rest["messages"]] == ["m0"] and rest["before"] is None
+
+
+def test_long_messages_are_compressed_and_still_searchable(client):
+    long_text = "the quick brown fox " * 200 + "zebracorn"
+    sid = new_session(("user", long_text), ("bot", "<think>hmm</think>" + long_text))
+    with app.read_db() as db:
+        stored = db.execute("SELECT message, clean_message FROM chats WHERE session_id=?", (sid,)).fetchall()
+    assert all(isinstance(row['clean_message'], bytes) for row in stored)
+    assert client.get(f"/history?session={sid}").get_json()["messages"][1]["content"] == "<think>hmm</think>" + long_text
+    assert [m["content"] for m in app.load_msgs(sid)] == [long_text, long_text]
+    assert client.get(f"/sessions?ids={sid}").get_json()["sessions"][0]["title"] == long_text[:80]
+    results = client.get(f"/search?q=zebracorn&ids={sid}").get_json()["results"]
+    assert len(results) == 2 and all("zebracorn" in r["snippet"] for r in results)
+
+
+def test_archived_session_round_trips_and_is_reindexed(client):
+    long_text = "archived words " * 200 + "quagga"
+    sid = new_session(("user", long_text), ("bot", "short answer"))
+    assert app.run_on_writer(app.MAINTENANCE_KEY, lambda db: app.archive_session(db, sid, "9999")) == 2
+    assert client.get(f"/search?q=quagga&ids={sid}").get_json()["results"] == []
+    assert [m["content"] for m in client.get(f"/history?session={sid}").get_json()["messages"]] == [long_text, "short answer"]
+    assert len(client.get(f"/search?q=quagga&ids={sid}").get_json()["results"]) == 1
+
+
+def test_repack_compresses_legacy_rows(client):
+    sid = str(uuid.uuid4())
+    long_text = "legacy row " * 299 + "legacy row"
+    app.run_on_writer(sid, lambda db: db.execute("INSERT INTO chats(session_id, role, message, clean_message) VALUES (?,?,?,?)", (sid, "user", long_text, long_text)))
+    _, _, saved = app.run_on_writer(app.MAINTENANCE_KEY, lambda db: app.repack_messages(db, 0, 10**6))
+    assert saved > 0
+    with app.read_db() as db:
+        row = db.execute("SELECT message, clean_message FROM chats WHERE session_id=?", (sid,)).fetchone()
+    assert row['message'] is None and isinstance(row['clean_message'], bytes)
+    assert [m["content"] for m in app.load_msgs(sid)] == [long_text]
+
+
+def test_opening_a_connection_leaves_the_writer_snapshot_alone(client):
+    writer = app.connect_db()
+    try:
+        writer.execute("BEGIN")
+        writer.execute("SELECT COUNT(*) FROM chats").fetchone()
+        app.connect_db().close()
+        writer.execute("INSERT INTO session_state(namespace, key, value, expires) VALUES ('test', 'k', 'v', 0)")
+    finally:
+        writer.rollback()
+        writer.close()
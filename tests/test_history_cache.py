@@ -0,0 +1,76 @@
+import threading
+import uuid
+
+import pytest
+
+import app
+
+
+@pytest.fixture(scope="module", autouse=True)
+def database(tmp_path_factory):
+    app.DB = str(tmp_path_factory.mktemp("db") / "chat_history.db")
+    app.init_db()
+
+
+def contents(sid):
+    return [m["content"] for m in app.load_msgs(sid)]
+
+
+@pytest.mark.parametrize("when", ["before", "after"])
+def test_load_racing_a_save_never_caches_a_stale_or_doubled_history(monkeypatch, when):
+    sid = str(uuid.uuid4())
+    app.save_msg(sid, "user", "first")
+    app.db_writer.wait(sid)
+    app.history_cache.invalidate(sid)
+    submit = app.db_writer.submit
+    readers = []
+
+    def reader():
+        thread = threading.Thread(target=app.load_msgs, args=(sid,))
+        thread.start()
+        thread.join(0.2)
+        readers.append(thread)
+
+    def racing_submit(key, op):
+        # A load for the same session landing just before or just after the write is queued.
+        if when == "before":
+            reader()
+        submit(key, op)
+        if when == "after":
+            reader()
+    monkeypatch.setattr(app.db_writer, "submit", racing_submit)
+    app.save_msg(sid, "bot", "second")
+    monkeypatch.undo()
+    for thread in readers:
+        thread.join()
+    assert contents(sid) == ["first", "second"]
+
+
+def test_continuation_is_visible_to_the_next_load():
+    sid = str(uuid.uuid4())
+    app.save_msg(sid, "user", "hi")
+    app.save_msg(sid, "bot", "hello")
+    assert contents(sid) == ["hi", "hello"]
+    app.update_last_bot_message(sid, " there")
+    assert contents(sid) == ["hi", "hello there"]
+
+
+def test_load_is_not_cached_when_the_writer_wait_times_out(monkeypatch):
+    sid = str(uuid.uuid4())
+    app.save_msg(sid, "user", "hi")
+    app.db_writer.wait(sid)
+    app.history_cache.invalidate(sid)
+    monkeypatch.setattr(app.db_writer, "wait", lambda sid=None, timeout=10: False)
+    assert contents(sid) == ["hi"]
+    assert app.history_cache.get(sid) is None
+
+
+def test_restoring_an_archived_session_drops_its_cached_history():
+    sid = str(uuid.uuid4())
+    app.save_msg(sid, "user", "old question")
+    app.db_writer.wait(sid)
+    app.run_on_writer(app.MAINTENANCE_KEY, lambda db: app.archive_session(db, sid, "9999"))
+    app.history_cache.end_load(sid, app.history_cache.begin_load(sid), [app.history_entry("user", "stale")])
+    app.run_on_writer(sid, lambda db: app.restore_session(db, sid))
+    assert app.history_cache.get(sid) is None
+    assert contents(sid) == ["old question"]
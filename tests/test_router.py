@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+import pytest
+
+import app
+
+SCRIPTS = {
+    "slow": ["slow answer"],
+    "broken": [app.StreamError("boom")],
+    "fast": ["fast ", "answer"],
+}
+
+
+@pytest.fixture(autouse=True)
+def providers(monkeypatch):
+    session = app.UpstreamSession()
+    for model in SCRIPTS:
+        monkeypatch.setitem(app.PROVIDERS, model, app.Provider(model, model.title(), None, None, session))
+    monkeypatch.setattr(app, "AUTO_MODELS", list(SCRIPTS))
+    monkeypatch.setattr(app, "HEDGE_AFTER_SECONDS", 0.1)
+    monkeypatch.setattr(app, "router", app.Router())
+    for model, ttft in (("slow", 0.1), ("broken", 0.2), ("fast", 0.3)):
+        app.router.record_ttft(model, ttft)
+
+    def stream_completion(model, sid, chat_history, cancel=None):
+        if model == "slow":
+            time.sleep(0.5)
+        yield from SCRIPTS[model]
+
+    async def astream_completion(model, sid, chat_history):
+        if model == "slow":
+            await asyncio.sleep(0.5)
+        for chunk in SCRIPTS[model]:
+            yield chunk
+    monkeypatch.setattr(app, "stream_completion", stream_completion)
+    monkeypatch.setattr(app, "astream_completion", astream_completion)
+
+
+def route(model):
+    return [str(chunk) for chunk in app.route_stream(model, "sid", []) if chunk != ""]
+
+
+def aroute(model):
+    async def main():
+        return [str(chunk) async for chunk in app.aroute_stream(model, "sid", [])]
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("run", [route, aroute])
+def test_auto_hedges_a_silent_provider(run):
+    started = time.monotonic()
+    assert run("auto") == ["fast ", "answer"]
+    assert time.monotonic() - started < 0.45
+    assert app.router.health["broken"].failures == 1
+
+
+@pytest.mark.parametrize("run", [route, aroute])
+def test_fallback_for_an_explicit_model_is_announced(run):
+    chunks = run("broken")
+    assert chunks[0].startswith("↪️ *Answered by Slow: Broken")
+    assert chunks[1:] == ["slow answer"]
+
+
+@pytest.mark.parametrize("run", [route, aroute])
+def test_without_fallback_the_error_is_the_answer(run, monkeypatch):
+    monkeypatch.setattr(app, "ROUTER_FALLBACK", False)
+    assert run("broken") == ["boom"]
+
+
+@pytest.mark.parametrize("run", [route, aroute])
+def test_open_circuit_is_skipped(run, monkeypatch):
+    monkeypatch.setattr(app, "ROUTER_FALLBACK", False)
+    for _ in range(app.CIRCUIT_FAILURES):
+        run("broken")
+    assert "temporarily unavailable" in run("broken")[0]
@@ -0,0 +1,14 @@
+import app
+
+
+def test_keep_alive_pools_hold_every_admitted_stream():
+    for provider in app.PROVIDERS.values():
+        adapter = provider.session.get_adapter("https://upstream.example")
+        assert adapter._pool_maxsize >= provider.admission.limit, provider.model
+
+
+def test_pool_grows_with_each_provider_on_a_session():
+    session = app.UpstreamSession()
+    first = app.Provider("a", "A", None, None, session, max_streams=3)
+    second = app.Provider("b", "B", None, None, session, max_streams=5)
+    assert session.get_adapter("http://upstream.example")._pool_maxsize == first.admission.limit + second.admission.limit